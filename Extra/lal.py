@@ -1,19 +1,85 @@
 #!/usr/bin/env python3
 
 import os
+import re
 import sys
-import click
-import json
-from typing import Optional
-from rich.console import Console
-from rich.panel import Panel
-from rich.prompt import Confirm
-from dotenv import load_dotenv
+import argparse
+import subprocess
 
-# Load environment variables
-load_dotenv()
+# rich and python-dotenv are imported on first use so `lal --help` and
+# argument errors don't pay their import cost
+_console = None
+_env_loaded = False
 
-console = Console()
+def get_console():
+    """Return the shared rich Console, creating it on first use"""
+    global _console
+    if _console is None:
+        from rich.console import Console
+        _console = Console()
+    return _console
+
+def load_env():
+    """Load environment variables from .env once"""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+SYSTEM_PROMPT = """You are a command-line expert. Convert natural language requests into appropriate shell commands.
+
+Rules:
+- Only return the command, no explanations
+- Use common Unix/Linux/macOS commands
+- Be precise and safe
+- If the request is unclear, return the most likely intended command
+- For dangerous commands, prefer safer alternatives
+
+Examples:
+- "git push" → git push
+- "what's running on port 8000" → lsof -i :8000
+- "list all files" → ls -la
+- "find large files" → find . -size +100M -type f
+"""
+
+# Generated commands that are refused outright: recursive deletes of / or ~,
+# fork bombs, and writes that would wipe a disk
+# An rm invocation up to the end of its shell command
+RM_COMMAND = re.compile(r'\brm\s+([^;&|\n]*)')
+PROTECTED_PATHS = {'/', '/*', '~', '~/', '~/*', '$HOME', '$HOME/', '$HOME/*', '${HOME}', '${HOME}/', '${HOME}/*'}
+
+DANGEROUS_PATTERNS = [
+    re.compile(r':\(\)\s*\{\s*:\s*\|\s*:\s*&\s*\}\s*;\s*:'),
+    re.compile(r'\bmkfs(\.\w+)?\b'),
+    re.compile(r'\bdd\b.*\bof=/dev/(sd|hd|nvme|disk|mmcblk)'),
+    re.compile(r'>\s*/dev/(sd|hd|nvme|disk|mmcblk)')
+]
+
+# Run through bash like an interactive shell would, where available
+SHELL = '/bin/bash' if os.path.exists('/bin/bash') else None
+
+def is_dangerous_rm(args: str) -> bool:
+    """Whether rm arguments force or recurse and name /, ~ or $HOME as any operand"""
+    words = [word.strip('"\'') for word in args.split()]
+    forced = any(word in ('--recursive', '--force') or
+                 (word.startswith('-') and not word.startswith('--') and any(c in word for c in 'rRf'))
+                 for word in words)
+    return forced and any(word in PROTECTED_PATHS for word in words)
+
+def is_dangerous(command: str) -> bool:
+    """Whether a generated command matches the deny-list"""
+    if any(is_dangerous_rm(match.group(1)) for match in RM_COMMAND.finditer(command)):
+        return True
+    return any(pattern.search(command) for pattern in DANGEROUS_PATTERNS)
+
+def run_command(command: str) -> int:
+    """Run a generated command in the shell and return its exit code"""
+    try:
+        return subprocess.run(command, shell=True, executable=SHELL).returncode
+    except KeyboardInterrupt:
+        # Ctrl+C stops the command, not the tool with a traceback
+        return 130
 
 class AIProvider:
     """Base class for AI providers"""
@@ -33,26 +99,10 @@ class OpenAIProvider(AIProvider):
             import openai
             client = openai.OpenAI(api_key=self.api_key)
             
-            system_prompt = """You are a command-line expert. Convert natural language requests into appropriate shell commands.
-            
-Rules:
-- Only return the command, no explanations
-- Use common Unix/Linux/macOS commands
-- Be precise and safe
-- If the request is unclear, return the most likely intended command
-- For dangerous commands, prefer safer alternatives
-
-Examples:
-- "git push" → git push
-- "what's running on port 8000" → lsof -i :8000
-- "list all files" → ls -la
-- "find large files" → find . -size +100M -type f
-"""
-            
             response = client.chat.completions.create(
                 model=self.model,
                 messages=[
-                    {"role": "system", "content": system_prompt},
+                    {"role": "system", "content": SYSTEM_PROMPT},
                     {"role": "user", "content": f"Command: {prompt}"}
                 ],
                 max_tokens=200,
@@ -76,27 +126,11 @@ class AnthropicProvider(AIProvider):
             import anthropic
             client = anthropic.Anthropic(api_key=self.api_key)
             
-            system_prompt = """You are a command-line expert. Convert natural language requests into appropriate shell commands.
-
-Rules:
-- Only return the command, no explanations
-- Use common Unix/Linux/macOS commands
-- Be precise and safe
-- If the request is unclear, return the most likely intended command
-- For dangerous commands, prefer safer alternatives
-
-Examples:
-- "git push" → git push
-- "what's running on port 8000" → lsof -i :8000
-- "list all files" → ls -la
-- "find large files" → find . -size +100M -type f
-"""
-            
             response = client.messages.create(
                 model=self.model,
                 max_tokens=200,
                 temperature=0.1,
-                system=system_prompt,
+                system=SYSTEM_PROMPT,
                 messages=[
                     {"role": "user", "content": f"Command: {prompt}"}
                 ]
@@ -122,25 +156,34 @@ def get_ai_provider() -> AIProvider:
     
     raise Exception("No AI provider configured. Set OPENAI_API_KEY or ANTHROPIC_API_KEY environment variable.")
 
-@click.command()
-@click.argument('prompt', required=False)
-@click.option('--execute', '-e', is_flag=True, help='Execute the command immediately')
-@click.option('--provider', '-p', type=click.Choice(['openai', 'anthropic']), help='Force specific AI provider')
-@click.option('--model', '-m', help='Specify model to use')
-@click.option('--config', is_flag=True, help='Configure API keys')
-def main(prompt: Optional[str], execute: bool, provider: Optional[str], model: Optional[str], config: bool):
-    """
-    LAL - Natural Language to Shell Commands
-    
-    Convert natural language descriptions into shell commands using AI.
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse command-line arguments"""
+    parser = argparse.ArgumentParser(
+        prog='lal',
+        description='LAL - Natural Language to Shell Commands\n\n'
+                    'Convert natural language descriptions into shell commands using AI.',
+        epilog='Examples:\n'
+               '  lal "git push"\n'
+               '  lal "what\'s running on port 8000"\n'
+               '  lal "find large files in current directory"',
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('prompt', nargs='?', help='Description of the command to generate')
+    parser.add_argument('--execute', '-e', action='store_true', help='Execute the command immediately')
+    parser.add_argument('--provider', '-p', choices=['openai', 'anthropic'], help='Force specific AI provider')
+    parser.add_argument('--model', '-m', help='Specify model to use')
+    parser.add_argument('--config', action='store_true', help='Configure API keys')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """LAL - Natural Language to Shell Commands"""
+    args = parse_args(argv)
+    prompt, execute, provider, model = args.prompt, args.execute, args.provider, args.model
     
-    Examples:
-      lal "git push"
-      lal "what's running on port 8000"
-      lal "find large files in current directory"
-    """
+    load_env()
+    console = get_console()
     
-    if config:
+    if args.config:
         configure_api_keys()
         return
     
@@ -177,6 +220,7 @@ def main(prompt: Optional[str], execute: bool, provider: Optional[str], model: O
             command = ai.generate_command(prompt)
         
         # Display result
+        from rich.panel import Panel
         console.print(Panel(
             f"[bold green]{command}[/]",
             title="Generated Command",
@@ -185,9 +229,13 @@ def main(prompt: Optional[str], execute: bool, provider: Optional[str], model: O
         
         # Execute if requested
         if execute:
+            if is_dangerous(command):
+                console.print("[red]Refusing to execute a potentially destructive command[/]")
+                return
+            from rich.prompt import Confirm
             if Confirm.ask("Execute this command?"):
                 console.print(f"\n[dim]Executing:[/] {command}")
-                os.system(command)
+                sys.exit(run_command(command))
         else:
             console.print("\n[dim]💡 Use -e flag to execute immediately[/]")
             
@@ -198,6 +246,7 @@ def main(prompt: Optional[str], execute: bool, provider: Optional[str], model: O
 
 def configure_api_keys():
     """Interactive configuration of API keys"""
+    console = get_console()
     console.print("[bold]🔧 LAL Configuration[/]\n")
     
     # Check current configuration
@@ -1,19 +1,26 @@
 #!/usr/bin/env python3
 
 import os
+import re
 import sys
 import json
+import subprocess
 import ssl
-import urllib.request
-import urllib.parse
+import time
+import hashlib
+import http.client
 from typing import Optional
 
-def make_anthropic_request(prompt: str, api_key: str) -> str:
-    """Make direct API call to Anthropic without using their library"""
-    
-    url = "https://api.anthropic.com/v1/messages"
-    
-    system_prompt = """You are a command-line expert. Convert natural language requests into appropriate shell commands.
+# orjson is optional; the script stays dependency-free without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ANTHROPIC_MODEL = "claude-3-5-haiku-20241022"
+OPENAI_MODEL = "gpt-4o-mini"
+
+SYSTEM_PROMPT = """You are a command-line expert. Convert natural language requests into appropriate shell commands.
 
 Rules:
 - Only return the command, no explanations
@@ -28,89 +35,181 @@ Examples:
 - "list all files" → ls -la
 - "find large files" → find . -size +100M -type f
 """
+
+# Generated commands are cached on disk for a day so repeated prompts skip the API
+CACHE_DIR = os.path.expanduser("~/.cache/lal")
+CACHE_TTL = 86400
+CACHE_MAX_ENTRIES = 500
+
+def cache_path(provider: str, model: str, prompt: str) -> str:
+    """Cache file for a provider/model/system prompt/prompt combination"""
+    key = hashlib.sha256(f"{provider}|{model}|{SYSTEM_PROMPT}|{prompt}".encode('utf-8')).hexdigest()
+    return os.path.join(CACHE_DIR, key)
+
+def read_cache(path: str) -> Optional[str]:
+    """Return a cached command if it exists and has not expired, deleting expired ones"""
+    try:
+        if time.time() - os.path.getmtime(path) > CACHE_TTL:
+            os.remove(path)
+            return None
+        with open(path, encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        return None
+
+def prune_cache():
+    """Keep only the newest CACHE_MAX_ENTRIES cache files"""
+    try:
+        entries = [entry for entry in os.scandir(CACHE_DIR) if entry.is_file()]
+        if len(entries) <= CACHE_MAX_ENTRIES:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - CACHE_MAX_ENTRIES]:
+            os.remove(entry.path)
+    except OSError:
+        pass
+
+def write_cache(path: str, command: str):
+    """Store a generated command, ignoring an unwritable cache directory"""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(command)
+    except OSError:
+        return
+    prune_cache()
+
+def generate_command(provider: str, prompt: str, api_key: str) -> str:
+    """Generate a command, answering repeated prompts from the cache"""
+    if provider == "anthropic":
+        model, request = ANTHROPIC_MODEL, make_anthropic_request
+    else:
+        model, request = OPENAI_MODEL, make_openai_request
     
-    data = {
-        "model": "claude-3-5-haiku-20241022",
-        "max_tokens": 200,
-        "temperature": 0.1,
-        "system": system_prompt,
-        "messages": [
-            {"role": "user", "content": f"Command: {prompt}"}
-        ]
-    }
+    path = cache_path(provider, model, prompt)
+    command = read_cache(path)
+    if command is None:
+        command = request(prompt, api_key)
+        write_cache(path, command)
+    return command
+
+# Create SSL context once (for macOS compatibility) and keep one connection
+# per host open so later calls skip the TCP and TLS handshake
+SSL_CONTEXT = ssl.create_default_context()
+_connections = {}
+
+def post_json(host: str, path: str, data: dict, headers: dict) -> dict:
+    """POST a JSON body over a reused HTTPS connection and decode the reply"""
+    conn = _connections.get(host)
+    if conn is None:
+        conn = http.client.HTTPSConnection(host, timeout=30, context=SSL_CONTEXT)
+        _connections[host] = conn
     
-    headers = {
-        "Content-Type": "application/json",
-        "x-api-key": api_key,
-        "anthropic-version": "2023-06-01"
-    }
+    try:
+        payload = orjson.dumps(data) if orjson else json.dumps(data).encode('utf-8')
+        conn.request("POST", path, body=payload, headers=headers)
+        response = conn.getresponse()
+        body = response.read()
+    except Exception:
+        # Drop the broken connection; the next call reopens it
+        conn.close()
+        del _connections[host]
+        raise
+    
+    if response.status != 200:
+        raise Exception(f"HTTP Error {response.status}: {response.reason}")
+    return orjson.loads(body) if orjson else json.loads(body.decode('utf-8'))
+
+# Invariant parts of each request; only the prompt and API key vary per call
+ANTHROPIC_BASE = {
+    "model": ANTHROPIC_MODEL,
+    "max_tokens": 200,
+    "temperature": 0.1,
+    "system": SYSTEM_PROMPT
+}
+
+OPENAI_BASE = {
+    "model": OPENAI_MODEL,
+    "max_tokens": 200,
+    "temperature": 0.1
+}
+
+OPENAI_SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+
+ANTHROPIC_HEADERS = {
+    "Content-Type": "application/json",
+    "anthropic-version": "2023-06-01"
+}
+
+OPENAI_HEADERS = {
+    "Content-Type": "application/json"
+}
+
+def make_anthropic_request(prompt: str, api_key: str) -> str:
+    """Make direct API call to Anthropic without using their library"""
     
-    req = urllib.request.Request(
-        url,
-        data=json.dumps(data).encode('utf-8'),
-        headers=headers
-    )
+    data = {**ANTHROPIC_BASE, "messages": [{"role": "user", "content": f"Command: {prompt}"}]}
+    headers = {**ANTHROPIC_HEADERS, "x-api-key": api_key}
     
     try:
-        # Create SSL context for macOS compatibility
-        ssl_context = ssl.create_default_context()
-        with urllib.request.urlopen(req, context=ssl_context) as response:
-            result = json.loads(response.read().decode('utf-8'))
-            return result['content'][0]['text'].strip()
+        result = post_json("api.anthropic.com", "/v1/messages", data, headers)
+        return result['content'][0]['text'].strip()
     except Exception as e:
         raise Exception(f"API error: {str(e)}")
 
 def make_openai_request(prompt: str, api_key: str) -> str:
     """Make direct API call to OpenAI without using their library"""
     
-    url = "https://api.openai.com/v1/chat/completions"
-    
-    system_prompt = """You are a command-line expert. Convert natural language requests into appropriate shell commands.
-
-Rules:
-- Only return the command, no explanations
-- Use common Unix/Linux/macOS commands
-- Be precise and safe
-- If the request is unclear, return the most likely intended command
-- For dangerous commands, prefer safer alternatives
-
-Examples:
-- "git push" → git push
-- "what's running on port 8000" → lsof -i :8000
-- "list all files" → ls -la
-- "find large files" → find . -size +100M -type f
-"""
-    
     data = {
-        "model": "gpt-4o-mini",
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"Command: {prompt}"}
-        ],
-        "max_tokens": 200,
-        "temperature": 0.1
+        **OPENAI_BASE,
+        "messages": [OPENAI_SYSTEM_MESSAGE, {"role": "user", "content": f"Command: {prompt}"}]
     }
-    
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}"
-    }
-    
-    req = urllib.request.Request(
-        url,
-        data=json.dumps(data).encode('utf-8'),
-        headers=headers
-    )
+    headers = {**OPENAI_HEADERS, "Authorization": f"Bearer {api_key}"}
     
     try:
-        # Create SSL context for macOS compatibility
-        ssl_context = ssl.create_default_context()
-        with urllib.request.urlopen(req, context=ssl_context) as response:
-            result = json.loads(response.read().decode('utf-8'))
-            return result['choices'][0]['message']['content'].strip()
+        result = post_json("api.openai.com", "/v1/chat/completions", data, headers)
+        return result['choices'][0]['message']['content'].strip()
     except Exception as e:
         raise Exception(f"API error: {str(e)}")
 
+# Generated commands that are refused outright: recursive deletes of / or ~,
+# fork bombs, and writes that would wipe a disk
+# An rm invocation up to the end of its shell command
+RM_COMMAND = re.compile(r'\brm\s+([^;&|\n]*)')
+PROTECTED_PATHS = {'/', '/*', '~', '~/', '~/*', '$HOME', '$HOME/', '$HOME/*', '${HOME}', '${HOME}/', '${HOME}/*'}
+
+DANGEROUS_PATTERNS = [
+    re.compile(r':\(\)\s*\{\s*:\s*\|\s*:\s*&\s*\}\s*;\s*:'),
+    re.compile(r'\bmkfs(\.\w+)?\b'),
+    re.compile(r'\bdd\b.*\bof=/dev/(sd|hd|nvme|disk|mmcblk)'),
+    re.compile(r'>\s*/dev/(sd|hd|nvme|disk|mmcblk)')
+]
+
+# Run through bash like an interactive shell would, where available
+SHELL = '/bin/bash' if os.path.exists('/bin/bash') else None
+
+def is_dangerous_rm(args: str) -> bool:
+    """Whether rm arguments force or recurse and name /, ~ or $HOME as any operand"""
+    words = [word.strip('"\'') for word in args.split()]
+    forced = any(word in ('--recursive', '--force') or
+                 (word.startswith('-') and not word.startswith('--') and any(c in word for c in 'rRf'))
+                 for word in words)
+    return forced and any(word in PROTECTED_PATHS for word in words)
+
+def is_dangerous(command: str) -> bool:
+    """Whether a generated command matches the deny-list"""
+    if any(is_dangerous_rm(match.group(1)) for match in RM_COMMAND.finditer(command)):
+        return True
+    return any(pattern.search(command) for pattern in DANGEROUS_PATTERNS)
+
+def run_command(command: str) -> int:
+    """Run a generated command in the shell and return its exit code"""
+    try:
+        return subprocess.run(command, shell=True, executable=SHELL).returncode
+    except KeyboardInterrupt:
+        # Ctrl+C stops the command, not the tool with a traceback
+        return 130
+
 def print_colored(text: str, color: str = "green"):
     """Simple colored output"""
     colors = {
@@ -168,18 +267,18 @@ def main():
             if not openai_key:
                 print_colored("❌ OpenAI API key not set", "red")
                 return
-            command = make_openai_request(prompt, openai_key)
+            command = generate_command("openai", prompt, openai_key)
         elif provider == "anthropic":
             if not anthropic_key:
                 print_colored("❌ Anthropic API key not set", "red")
                 return
-            command = make_anthropic_request(prompt, anthropic_key)
+            command = generate_command("anthropic", prompt, anthropic_key)
         else:
             # Auto-select (prefer Anthropic)
             if anthropic_key:
-                command = make_anthropic_request(prompt, anthropic_key)
+                command = generate_command("anthropic", prompt, anthropic_key)
             else:
-                command = make_openai_request(prompt, openai_key)
+                command = generate_command("openai", prompt, openai_key)
         
         # Display result
         print("╭─" + "─" * 50 + " Generated Command " + "─" * 50 + "─╮")
@@ -187,10 +286,13 @@ def main():
         print("╰─" + "─" * 100 + "─╯")
         
         if execute:
+            if is_dangerous(command):
+                print_colored("❌ Refusing to execute a potentially destructive command", "red")
+                return
             response = input("\nExecute this command? [y/n]: ")
             if response.lower() == 'y':
                 print(f"\nExecuting: {command}")
-                os.system(command)
+                sys.exit(run_command(command))
         else:
             print_colored("\n💡 Use --execute or -e flag to execute immediately", "blue")
             
@@ -1,110 +1,659 @@
 #!/usr/bin/env python3
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, abort
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
 import json
-from datetime import datetime, timedelta
+import re
+import socket
+import threading
+from array import array
+from datetime import datetime
 import hashlib
+import functools
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from cachetools import TTLCache
+import redis
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def dumps(obj):
+    """Serialize to JSON bytes (orjson when installed)"""
+    if orjson:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode()
+
+def loads(data):
+    """Parse JSON from bytes or str (orjson when installed)"""
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+# Request body limits; /generate bodies are tiny, so oversized ones are
+# rejected before they are read
+MAX_BODY_BYTES = 4096
+MAX_BATCH_BODY_BYTES = 256 * 1024
+MAX_PROMPT_CHARS = 2000
+
+# Number of reverse proxies in front of the app whose X-Forwarded-For is
+# trusted, so rate limits see the client IP rather than the proxy's. Off by
+# default: when clients connect directly they could forge the header to get
+# a fresh daily quota per request. The Procfile (PaaS deployment) sets 1.
+TRUSTED_PROXIES = int(os.getenv('LAL_TRUSTED_PROXIES', '0'))
 
 app = Flask(__name__)
+app.config['MAX_CONTENT_LENGTH'] = MAX_BATCH_BODY_BYTES
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES)
 CORS(app)
 
+def body_limit():
+    """Maximum body size for the current endpoint"""
+    return MAX_BATCH_BODY_BYTES if request.endpoint == 'generate_batch' else MAX_BODY_BYTES
+
+@app.errorhandler(413)
+def body_too_large(error):
+    """JSON error for oversized request bodies"""
+    return jsonify({'error': 'Request body too large'}), 413
+
+@app.before_request
+def limit_body_size():
+    """Reject oversized bodies from their Content-Length alone"""
+    if request.content_length and request.content_length > body_limit():
+        abort(413)
+
+def read_json():
+    """Parse the request body as JSON, None if it is not a JSON object
+
+    Bodies sent without a Content-Length (chunked) are read only up to the
+    endpoint's limit, aborting with 413 beyond it.
+    """
+    limit = body_limit()
+    body = request.stream.read(limit + 1)
+    if len(body) > limit:
+        abort(413)
+    try:
+        data = loads(body)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+def valid_prompt(prompt):
+    """Whether a prompt is a non-empty string within MAX_PROMPT_CHARS"""
+    return isinstance(prompt, str) and 0 < len(prompt) <= MAX_PROMPT_CHARS
+
 # Your hidden API keys (set as environment variables in production)
 ANTHROPIC_API_KEY = os.getenv('ANTHROPIC_API_KEY')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 
-# Simple rate limiting (in production, use Redis)
-usage_tracker = {}
+ANTHROPIC_MODEL = "claude-3-5-haiku-20241022"
+OPENAI_MODEL = "gpt-4o-mini"
+
+ANTHROPIC_SYSTEM = "You are a command-line expert. Convert natural language requests into shell commands. CRITICAL: Return ONLY the command structure, no explanations, no context, no additional text whatsoever. MOST CRITICAL INSTRUCTION: When asked to generate content like essays, code, or text files, you MUST use ONLY the exact placeholder text 'content...' or 'code...' inside a here-document. NEVER include any actual implementation or content. EXAMPLES: git push -> git push, what's running on port 8000 -> lsof -i :8000, write essay about rice -> cat > essay.txt << EOF\\ncontent...\\nEOF, create bash script -> cat > script.sh << EOF\\n#!/bin/bash\\ncode...\\nEOF, create python script -> cat > script.py << EOF\\ncode...\\nEOF"
+
+OPENAI_SYSTEM = "You are a command-line expert. Convert natural language requests into shell commands. CRITICAL: Return ONLY the command structure, no explanations, no context, no additional text whatsoever. MOST CRITICAL INSTRUCTION: When asked to generate content like essays, code, or text files, you MUST use ONLY the exact placeholder text 'content...' or 'code...' inside a here-document. NEVER include any actual implementation or content. EXAMPLES: git push -> git push, what's running on port 8000 -> lsof -i :8000, write essay about rice -> cat > essay.txt << EOF\ncontent...\nEOF, create bash script -> cat > script.sh << EOF\n#!/bin/bash\ncode...\nEOF, create python script -> cat > script.py << EOF\ncode...\nEOF"
+
+ANTHROPIC_URL = "https://api.anthropic.com/v1/messages"
+OPENAI_URL = "https://api.openai.com/v1/chat/completions"
+ANTHROPIC_BATCH_URL = "https://api.anthropic.com/v1/messages/batches"
+OPENAI_FILES_URL = "https://api.openai.com/v1/files"
+OPENAI_BATCH_URL = "https://api.openai.com/v1/batches"
+
+ANTHROPIC_HEADERS = {
+    "Content-Type": "application/json",
+    "x-api-key": ANTHROPIC_API_KEY,
+    "anthropic-version": "2023-06-01"
+}
+
+OPENAI_HEADERS = {
+    "Content-Type": "application/json",
+    "Authorization": f"Bearer {OPENAI_API_KEY}"
+}
+
+# (connect, read) timeouts for upstream calls
+UPSTREAM_TIMEOUT = (3.05, 30)
+
+# TCP keepalive probes only keep NAT/load-balancer paths from silently
+# dropping idle pooled sockets; the connection stays HTTP/1.1, and a socket
+# the provider itself closes still costs a fresh TLS handshake
+KEEPALIVE_OPTIONS = HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+if hasattr(socket, 'TCP_KEEPIDLE'):
+    KEEPALIVE_OPTIONS += [
+        (socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 60),
+        (socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 30)
+    ]
+
+class KeepAliveAdapter(HTTPAdapter):
+    """HTTPAdapter whose pooled connections enable TCP keepalive"""
+    
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = KEEPALIVE_OPTIONS
+        super().init_poolmanager(*args, **kwargs)
+
+# Shared session so keep-alive sockets to the providers are reused between
+# requests served by the same worker instead of a new TLS handshake per call
+SESSION = requests.Session()
+_adapter = KeepAliveAdapter(
+    pool_connections=4,
+    pool_maxsize=32,
+    # Transient 5xx are retried; 429 is not (its Retry-After could outlast the
+    # worker timeout), and the last response is returned rather than raised so
+    # it still reaches api_error() and the OpenAI fallback
+    max_retries=Retry(
+        total=2,
+        backoff_factor=0.2,
+        status_forcelist=[500, 502, 503, 504],
+        allowed_methods=frozenset(['POST']),
+        raise_on_status=False
+    )
+)
+SESSION.mount("https://api.anthropic.com", _adapter)
+SESSION.mount("https://api.openai.com", _adapter)
+
+# Responses are near-deterministic (temperature 0.1), so identical prompts
+# are answered from memory instead of another upstream round-trip
+response_cache = TTLCache(maxsize=10_000, ttl=86400)
+cache_stats = {'hits': 0, 'misses': 0}
+cache_lock = threading.RLock()
+
+MAX_BATCH_PROMPTS = 100
+
+# Microbatching of concurrent /generate calls (off unless a window is set)
+MICROBATCH_WINDOW = int(os.getenv('LAL_MICROBATCH_MS', '0')) / 1000
+MICROBATCH_SIZE = 8
+
+# Rate limiting: shared across workers in Redis when REDIS_URL is set,
+# otherwise per-process counts for the current UTC day, dropped on rollover
+REDIS_URL = os.getenv('REDIS_URL')
+# Short timeouts so an unreachable Redis fails the request quickly instead
+# of hanging it until the gunicorn worker timeout
+redis_client = redis.Redis.from_url(
+    REDIS_URL,
+    decode_responses=True,
+    socket_timeout=0.5,
+    socket_connect_timeout=0.5
+) if REDIS_URL else None
+usage_lock = threading.Lock()
+usage_day = None
 DAILY_LIMIT = 50  # Free tier: 50 requests per day per user
 
+# In-process counting is two-tier: every user starts in a Count-Min sketch,
+# SKETCH_DEPTH rows of counters each indexed by its own hash. A user's
+# estimate is the minimum of their counters, an upper bound that is only
+# inflated if every row collides with heavier users. Users whose estimate
+# nears the limit get an exact entry in usage_counts, seeded with it
+SKETCH_WIDTH = 2 ** 16
+SKETCH_DEPTH = 4
+SKETCH_LIMIT = DAILY_LIMIT - 5
+
+def new_sketch():
+    """Zeroed sketch counters, one row per hash"""
+    return [array('H', bytes(2 * SKETCH_WIDTH)) for _ in range(SKETCH_DEPTH)]
+
+usage_sketch = new_sketch()
+usage_counts = {}
+
+@functools.lru_cache(maxsize=4096)
+def hash_ip(ip):
+    """Hash an IP into an anonymous user ID (memoized, the mapping is stable)"""
+    return hashlib.blake2b(ip.encode(), digest_size=16).hexdigest()
+
 def get_user_id(request):
     """Generate anonymous user ID based on IP"""
-    ip = request.remote_addr
-    return hashlib.md5(ip.encode()).hexdigest()
+    return hash_ip(request.remote_addr)
+
+def current_day():
+    """Today's date in UTC, e.g. 2024-01-31"""
+    return datetime.utcnow().date().isoformat()
+
+def roll_usage(today):
+    """Reset usage counts when the day changes (caller holds usage_lock)"""
+    global usage_day, usage_sketch
+    if today != usage_day:
+        usage_sketch = new_sketch()
+        usage_counts.clear()
+        usage_day = today
+
+def sketch_buckets(user_id):
+    """A user's counter index in each sketch row"""
+    return [hash((row, user_id)) % SKETCH_WIDTH for row in range(SKETCH_DEPTH)]
+
+def sketch_estimate(buckets):
+    """Upper bound on a user's count: the smallest of their counters"""
+    return min(counters[bucket] for counters, bucket in zip(usage_sketch, buckets))
+
+def usage_key(user_id, today):
+    """Redis key holding a user's count for the day"""
+    return f"lal:{user_id}:{today}"
 
-def check_rate_limit(user_id):
+def check_rate_limit(user_id, cost=1):
     """Check if user is within rate limits"""
-    today = datetime.now().strftime('%Y-%m-%d')
-    key = f"{user_id}:{today}"
+    today = current_day()
     
-    if key not in usage_tracker:
-        usage_tracker[key] = 0
+    if redis_client:
+        key = usage_key(user_id, today)
+        pipe = redis_client.pipeline()
+        pipe.incrby(key, cost)
+        pipe.expire(key, 86400, nx=True)
+        count, _ = pipe.execute()
+        if count > DAILY_LIMIT:
+            # Rejected requests don't count against the limit
+            redis_client.decrby(key, cost)
+            return False
+        return True
     
-    if usage_tracker[key] >= DAILY_LIMIT:
+    with usage_lock:
+        roll_usage(today)
+        used = usage_counts.get(user_id)
+        if used is None:
+            buckets = sketch_buckets(user_id)
+            estimate = sketch_estimate(buckets)
+            if estimate + cost <= SKETCH_LIMIT:
+                # Conservative update: only raise counters below the new
+                # estimate, which keeps the other rows' counts tighter
+                for counters, bucket in zip(usage_sketch, buckets):
+                    counters[bucket] = max(counters[bucket], estimate + cost)
+                return True
+            used = estimate
+        
+        if used + cost > DAILY_LIMIT:
+            usage_counts[user_id] = used
+            return False
+        usage_counts[user_id] = used + cost
+        return True
+
+def get_used(user_id, today):
+    """Number of requests a user has made today"""
+    if redis_client:
+        return int(redis_client.get(usage_key(user_id, today)) or 0)
+    
+    with usage_lock:
+        roll_usage(today)
+        if user_id in usage_counts:
+            return usage_counts[user_id]
+        return sketch_estimate(sketch_buckets(user_id))
+
+# Invariant part of each request body (model, limits, system prompt). The
+# single-call paths pre-serialize it once and splice in only the user prompt
+ANTHROPIC_BASE = {
+    "model": ANTHROPIC_MODEL,
+    "max_tokens": 200,
+    "temperature": 0.1,
+    "system": ANTHROPIC_SYSTEM
+}
+
+OPENAI_BASE = {
+    "model": OPENAI_MODEL,
+    "max_tokens": 200,
+    "temperature": 0.1
+}
+
+OPENAI_SYSTEM_MESSAGE = {"role": "system", "content": OPENAI_SYSTEM}
+
+# Single calls stream the reply so they can stop after the first line
+ANTHROPIC_PREFIX = dumps({**ANTHROPIC_BASE, "stream": True})[:-1] + b',"messages":[{"role":"user","content":'
+OPENAI_PREFIX = (
+    dumps({**OPENAI_BASE, "stream": True, "messages": [OPENAI_SYSTEM_MESSAGE]})[:-2]
+    + b',{"role":"user","content":'
+)
+
+PAYLOAD_SUFFIX = b'}]}'
+
+def anthropic_body(prompt):
+    """Build the Anthropic messages request body"""
+    return {**ANTHROPIC_BASE, "messages": [{"role": "user", "content": f"Command: {prompt}"}]}
+
+def openai_body(prompt):
+    """Build the OpenAI chat completions request body"""
+    return {
+        **OPENAI_BASE,
+        "messages": [OPENAI_SYSTEM_MESSAGE, {"role": "user", "content": f"Command: {prompt}"}]
+    }
+
+def anthropic_payload(prompt):
+    """Serialized streaming anthropic_body(prompt), reusing the pre-serialized prefix"""
+    return ANTHROPIC_PREFIX + dumps(f"Command: {prompt}") + PAYLOAD_SUFFIX
+
+def openai_payload(prompt):
+    """Serialized streaming openai_body(prompt), reusing the pre-serialized prefix"""
+    return OPENAI_PREFIX + dumps(f"Command: {prompt}") + PAYLOAD_SUFFIX
+
+def api_error(response):
+    """Extract the error message from a failed upstream response"""
+    try:
+        error = loads(response.content).get('error', 'Unknown error')
+    except ValueError:
+        error = response.text or 'Unknown error'
+    if isinstance(error, dict):
+        error = error.get('message', error)
+    return Exception(f"API error: {error}")
+
+# Line endings that mean the command continues on the next line
+CONTINUED_ENDINGS = ('\\', '|', '&&', '||', '{', '(')
+CONTINUED_WORDS = ('do', 'then', 'else', 'elif')
+HEREDOC = re.compile(r"<<-?\s*['\"]?(\w+)['\"]?")
+FENCE = '```'
+
+def is_complete(command):
+    """Whether a command is finished: every here-document is closed and the
+    last line does not continue (trailing backslash, pipe, && / ||, an
+    opening brace or an unfinished loop/if body such as `for f in *; do`)"""
+    lines = [line.rstrip() for line in command.strip().split('\n')]
+    
+    pending = []
+    for line in lines:
+        if pending and line.strip() == pending[0]:
+            pending.pop(0)
+        elif not pending:
+            pending = HEREDOC.findall(line)
+    if pending or not lines[-1]:
         return False
     
-    usage_tracker[key] += 1
-    return True
+    last = lines[-1]
+    return not last.endswith(CONTINUED_ENDINGS) and last.split()[-1] not in CONTINUED_WORDS
+
+def strip_fences(text):
+    """Drop a markdown code fence the model may wrap the command in"""
+    lines = text.strip().split('\n')
+    if lines and lines[0].startswith(FENCE):
+        lines = lines[1:]
+        if lines and lines[-1].strip().startswith(FENCE):
+            lines = lines[:-1]
+    return '\n'.join(lines).strip()
+
+def finished_command(text):
+    """The command a partially streamed reply is known to hold, else None
+    
+    The reply is over once a finished command block is followed by a blank
+    line (anything after is explanation the system prompt forbids) or, for
+    a fenced reply, by its closing fence. A plain second command line keeps
+    the stream going, so multi-command replies are returned whole.
+    """
+    lines = text.lstrip().split('\n')
+    if lines[0].startswith(FENCE):
+        for i in range(1, len(lines) - 1):
+            if lines[i].strip().startswith(FENCE):
+                block = '\n'.join(lines[1:i])
+                return block.strip() if block.strip() and is_complete(block) else None
+        return None
+    
+    # The last element is still being streamed
+    for i in range(1, len(lines) - 1):
+        if not lines[i].strip():
+            block = '\n'.join(lines[:i])
+            if is_complete(block):
+                return block.strip()
+    return None
+
+def drain(response):
+    """Read a stream to its end so its connection goes back to the pool"""
+    try:
+        for _ in response.iter_content(chunk_size=None):
+            pass
+    finally:
+        response.close()
+
+# Finishes streams whose answer was already returned. Closing mid-response
+# would discard the pooled socket; the tail is at most max_tokens (200) long,
+# so reading it off the request path is cheap and keeps the socket warm
+DRAIN_EXECUTOR = ThreadPoolExecutor(max_workers=4)
+
+def stream_command(url, headers, payload, delta):
+    """POST a streaming request and collect the text deltas from its SSE events
+    
+    Returns (command, complete); complete is False when the reply was cut
+    short, by returning before the stream ended or by hitting max_tokens,
+    so callers do not cache a possibly partial command.
+    """
+    response = SESSION.post(url, headers=headers, data=payload, stream=True, timeout=UPSTREAM_TIMEOUT)
+    draining = False
+    try:
+        if response.status_code != 200:
+            raise api_error(response)
+        
+        text = ''
+        complete = True
+        for line in response.iter_lines():
+            if not line.startswith(b'data:'):
+                continue
+            data = line[5:].strip()
+            if data == b'[DONE]':
+                break
+            piece, hit_limit = delta(loads(data))
+            text += piece
+            complete = complete and not hit_limit
+            command = finished_command(text)
+            if command is not None:
+                DRAIN_EXECUTOR.submit(drain, response)
+                draining = True
+                return command, False
+        return strip_fences(text), complete
+    finally:
+        if not draining:
+            response.close()
+
+def anthropic_delta(event):
+    """Text carried by an Anthropic stream event, and whether max_tokens was hit"""
+    if event.get('type') == 'error':
+        raise Exception(f"API error: {event['error'].get('message', 'Unknown error')}")
+    if event.get('type') == 'content_block_delta':
+        return event['delta'].get('text', ''), False
+    if event.get('type') == 'message_delta':
+        return '', event['delta'].get('stop_reason') == 'max_tokens'
+    return '', False
+
+def openai_delta(event):
+    """Text carried by an OpenAI stream chunk, and whether max_tokens was hit"""
+    choices = event.get('choices')
+    if not choices:
+        return '', False
+    choice = choices[0]
+    return choice.get('delta', {}).get('content') or '', choice.get('finish_reason') == 'length'
 
 def call_anthropic(prompt):
-    """Call Anthropic API"""
-    url = "https://api.anthropic.com/v1/messages"
+    """Call Anthropic API, returning (command, complete)"""
+    return stream_command(ANTHROPIC_URL, ANTHROPIC_HEADERS, anthropic_payload(prompt), anthropic_delta)
+
+def call_openai(prompt):
+    """Call OpenAI API (fallback), returning (command, complete)"""
+    return stream_command(OPENAI_URL, OPENAI_HEADERS, openai_payload(prompt), openai_delta)
+
+UPSTREAM_CALLS = {
+    'anthropic': (call_anthropic, ANTHROPIC_MODEL, ANTHROPIC_SYSTEM),
+    'openai': (call_openai, OPENAI_MODEL, OPENAI_SYSTEM)
+}
+
+def cached_call(provider, prompt, user_id=None):
+    """Call a provider, reusing a cached answer for an identical request"""
+    call, model, system = UPSTREAM_CALLS[provider]
+    key = hashlib.sha256(f"{provider}|{model}|{system}|{prompt}".encode()).hexdigest()
     
-    headers = {
-        "Content-Type": "application/json",
-        "x-api-key": ANTHROPIC_API_KEY,
-        "anthropic-version": "2023-06-01"
-    }
+    with cache_lock:
+        command = response_cache.get(key)
+        if command is not None:
+            cache_stats['hits'] += 1
+            return command
+        cache_stats['misses'] += 1
     
-    data = {
-        "model": "claude-3-5-haiku-20241022",
-        "max_tokens": 200,
-        "temperature": 0.1,
-        "system": "You are a command-line expert. Convert natural language requests into shell commands. CRITICAL: Return ONLY the command structure, no explanations, no context, no additional text whatsoever. MOST CRITICAL INSTRUCTION: When asked to generate content like essays, code, or text files, you MUST use ONLY the exact placeholder text 'content...' or 'code...' inside a here-document. NEVER include any actual implementation or content. EXAMPLES: git push -> git push, what's running on port 8000 -> lsof -i :8000, write essay about rice -> cat > essay.txt << EOF\\ncontent...\\nEOF, create bash script -> cat > script.sh << EOF\\n#!/bin/bash\\ncode...\\nEOF, create python script -> cat > script.py << EOF\\ncode...\\nEOF",
-        "messages": [{"role": "user", "content": f"Command: {prompt}"}]
-    }
+    if BATCHERS and user_id and '\n' not in prompt:
+        # Lines of a shared reply can be steered by the caller's other
+        # prompts, so they are never cached for everyone
+        return BATCHERS[provider].submit(user_id, prompt)
     
-    response = requests.post(url, headers=headers, json=data)
-    result = response.json()
+    command, complete = call(prompt)
+    if complete:
+        with cache_lock:
+            response_cache[key] = command
+    return command
+
+# Request threads per gunicorn worker (read by gunicorn.conf.py as well)
+WORKER_THREADS = int(os.getenv('LAL_WORKER_THREADS', '16'))
+
+# Threads for racing both providers against each other; each race takes two,
+# so every request thread can race at once without queueing behind others
+EXECUTOR = ThreadPoolExecutor(max_workers=2 * WORKER_THREADS)
+
+def race_providers(prompt, user_id=None):
+    """Ask both providers at once and return the first successful command"""
+    pending = {EXECUTOR.submit(cached_call, provider, prompt, user_id) for provider in UPSTREAM_CALLS}
+    errors = []
     
-    if response.status_code == 200:
-        return result['content'][0]['text'].strip()
-    else:
-        raise Exception(f"API error: {result.get('error', 'Unknown error')}")
+    while pending:
+        done, pending = wait(pending, timeout=UPSTREAM_TIMEOUT[1], return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            try:
+                command = future.result()
+            except Exception as e:
+                errors.append(str(e))
+                continue
+            for other in pending:
+                other.cancel()
+            return command
+    
+    raise Exception(f"Both APIs failed: {'; '.join(errors) or 'timed out'}")
 
-def call_openai(prompt):
-    """Call OpenAI API (fallback)"""
-    url = "https://api.openai.com/v1/chat/completions"
+NUMBERED_LINE = re.compile(r'^\s*(\d+)[).:]\s*(.+)$')
+
+def numbered_request(prompts):
+    """One user message asking for a numbered command per prompt"""
+    lines = "\n".join(f"{i}) Command: {prompt}" for i, prompt in enumerate(prompts, 1))
+    return (
+        f"Reply with one command per request below, each starting with the "
+        f"request's number like \"1) \". A command that needs several lines "
+        f"continues on unnumbered lines.\n{lines}"
+    )
+
+def numbered_commands(reply, count):
+    """Map each request index to its command in a numbered reply
     
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {OPENAI_API_KEY}"
+    Numbers are only taken in order, so a command line that happens to start
+    with a digit is not mistaken for the next item; unnumbered lines belong
+    to the command above them and markdown fences are skipped.
+    """
+    commands = []
+    for line in reply.splitlines():
+        if line.strip().startswith(FENCE):
+            continue
+        match = NUMBERED_LINE.match(line)
+        if match and int(match.group(1)) == len(commands) + 1 and len(commands) < count:
+            commands.append([match.group(2)])
+        elif commands:
+            commands[-1].append(line)
+    return {i: '\n'.join(lines).strip() for i, lines in enumerate(commands)}
+
+def call_anthropic_many(prompts):
+    """Generate commands for several prompts in one Anthropic call"""
+    data = {
+        **ANTHROPIC_BASE,
+        "max_tokens": ANTHROPIC_BASE["max_tokens"] * len(prompts),
+        "messages": [{"role": "user", "content": numbered_request(prompts)}]
     }
-    
+    response = SESSION.post(ANTHROPIC_URL, headers=ANTHROPIC_HEADERS, data=dumps(data), timeout=UPSTREAM_TIMEOUT)
+    if response.status_code != 200:
+        raise api_error(response)
+    return loads(response.content)['content'][0]['text']
+
+def call_openai_many(prompts):
+    """Generate commands for several prompts in one OpenAI call"""
     data = {
-        "model": "gpt-4o-mini",
-        "max_tokens": 200,
-        "temperature": 0.1,
-        "messages": [
-            {
-                "role": "system", 
-                "content": "You are a command-line expert. Convert natural language requests into shell commands. CRITICAL: Return ONLY the command structure, no explanations, no context, no additional text whatsoever. MOST CRITICAL INSTRUCTION: When asked to generate content like essays, code, or text files, you MUST use ONLY the exact placeholder text 'content...' or 'code...' inside a here-document. NEVER include any actual implementation or content. EXAMPLES: git push -> git push, what's running on port 8000 -> lsof -i :8000, write essay about rice -> cat > essay.txt << EOF\ncontent...\nEOF, create bash script -> cat > script.sh << EOF\n#!/bin/bash\ncode...\nEOF, create python script -> cat > script.py << EOF\ncode...\nEOF"
-            },
-            {
-                "role": "user", 
-                "content": f"Command: {prompt}"
-            }
-        ]
+        **OPENAI_BASE,
+        "max_tokens": OPENAI_BASE["max_tokens"] * len(prompts),
+        "messages": [OPENAI_SYSTEM_MESSAGE, {"role": "user", "content": numbered_request(prompts)}]
     }
+    response = SESSION.post(OPENAI_URL, headers=OPENAI_HEADERS, data=dumps(data), timeout=UPSTREAM_TIMEOUT)
+    if response.status_code != 200:
+        raise api_error(response)
+    return loads(response.content)['choices'][0]['message']['content']
+
+class MicroBatcher:
+    """Coalesces one user's prompts arriving within a short window into one upstream call
     
-    response = requests.post(url, headers=headers, json=data)
-    result = response.json()
+    Batches are keyed by user id, so a numbered reply only ever carries a
+    single caller's own prompts (the scripted-loop case) and no user can
+    steer the command returned to another. The first prompt of a burst
+    starts a timer; when it fires, or MICROBATCH_SIZE prompts are queued,
+    the batch is sent as one numbered message and each waiting request gets
+    its item of the reply. Prompts whose item is missing or unfinished are
+    retried individually.
+    """
     
-    if response.status_code == 200:
-        return result['choices'][0]['message']['content'].strip()
-    else:
-        raise Exception(f"API error: {result.get('error', {}).get('message', 'Unknown error')}")
+    def __init__(self, call, call_many):
+        self.call = call
+        self.call_many = call_many
+        self.lock = threading.Lock()
+        self.pending = {}
+    
+    def submit(self, user_id, prompt):
+        """Queue a prompt in the user's batch and wait for its command"""
+        future = Future()
+        full = None
+        with self.lock:
+            batch = self.pending.setdefault(user_id, [])
+            batch.append((prompt, future))
+            if len(batch) >= MICROBATCH_SIZE:
+                full = self.pending.pop(user_id)
+            elif len(batch) == 1:
+                timer = threading.Timer(MICROBATCH_WINDOW, self.flush, (user_id, batch))
+                timer.daemon = True
+                timer.start()
+        
+        if full:
+            self.dispatch(full)
+        return future.result()
+    
+    def flush(self, user_id, batch):
+        """Send a user's batch once its window has passed, unless already sent"""
+        with self.lock:
+            if self.pending.get(user_id) is not batch:
+                return
+            del self.pending[user_id]
+        self.dispatch(batch)
+    
+    def dispatch(self, batch):
+        """Answer a batch of (prompt, future) pairs"""
+        commands = {}
+        if len(batch) > 1:
+            try:
+                reply = self.call_many([prompt for prompt, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                return
+            commands = numbered_commands(reply, len(batch))
+        
+        for i, (prompt, future) in enumerate(batch):
+            try:
+                # A missing or cut-off command is asked for again on its own
+                command = commands.get(i)
+                future.set_result(command if command and is_complete(command) else self.call(prompt)[0])
+            except Exception as e:
+                future.set_exception(e)
+
+BATCHERS = {
+    'anthropic': MicroBatcher(call_anthropic, call_anthropic_many),
+    'openai': MicroBatcher(call_openai, call_openai_many)
+} if MICROBATCH_WINDOW > 0 else {}
 
 @app.route('/generate', methods=['POST'])
 def generate_command():
     """Generate shell command from natural language"""
+    data = read_json()
+    if not data or 'prompt' not in data:
+        return jsonify({'error': 'Missing prompt'}), 400
+    if not valid_prompt(data['prompt']):
+        return jsonify({'error': f'Prompt must be a string of 1-{MAX_PROMPT_CHARS} characters'}), 400
+    
     try:
-        data = request.get_json()
-        if not data or 'prompt' not in data:
-            return jsonify({'error': 'Missing prompt'}), 400
-        
         prompt = data['prompt']
         user_id = get_user_id(request)
         
@@ -115,26 +664,29 @@ def generate_command():
                 'message': f'Daily limit of {DAILY_LIMIT} requests reached. Try again tomorrow.'
             }), 429
         
-        # Generate command (try Anthropic, fall back to OpenAI)
+        # Generate command (try Anthropic, fall back to OpenAI, or race
+        # both when the caller asks for the fastest answer)
         try:
-            if ANTHROPIC_API_KEY:
-                command = call_anthropic(prompt)
+            if data.get('race') and ANTHROPIC_API_KEY and OPENAI_API_KEY:
+                command = race_providers(prompt, user_id)
+            elif ANTHROPIC_API_KEY:
+                command = cached_call('anthropic', prompt, user_id)
             elif OPENAI_API_KEY:
-                command = call_openai(prompt)
+                command = cached_call('openai', prompt, user_id)
             else:
                 return jsonify({'error': 'No API keys configured on server'}), 500
         except Exception as api_error:
             # Try fallback if primary fails
             if str(api_error).startswith("API error") and OPENAI_API_KEY and ANTHROPIC_API_KEY:
                 try:
-                    command = call_openai(prompt)
+                    command = cached_call('openai', prompt, user_id)
                 except Exception as fallback_error:
                     return jsonify({'error': f'Both APIs failed: {str(fallback_error)}'}), 500
             else:
                 raise
         
         # Track usage
-        remaining = DAILY_LIMIT - usage_tracker.get(f"{user_id}:{datetime.now().strftime('%Y-%m-%d')}", 0)
+        remaining = DAILY_LIMIT - get_used(user_id, current_day())
         
         return jsonify({
             'command': command,
@@ -144,17 +696,181 @@ def generate_command():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def submit_anthropic_batch(prompts):
+    """Submit prompts to the Anthropic Message Batches API"""
+    data = {
+        "requests": [
+            {"custom_id": str(i), "params": anthropic_body(prompt)}
+            for i, prompt in enumerate(prompts)
+        ]
+    }
+    
+    response = SESSION.post(ANTHROPIC_BATCH_URL, headers=ANTHROPIC_HEADERS, data=dumps(data), timeout=UPSTREAM_TIMEOUT)
+    if response.status_code != 200:
+        raise api_error(response)
+    return loads(response.content)['id']
+
+def submit_openai_batch(prompts):
+    """Upload prompts as an NDJSON file and submit them to the OpenAI Batch API"""
+    lines = [
+        dumps({
+            "custom_id": str(i),
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": openai_body(prompt)
+        })
+        for i, prompt in enumerate(prompts)
+    ]
+    # Multipart upload, so only the auth header is shared with JSON calls
+    auth = {"Authorization": OPENAI_HEADERS["Authorization"]}
+    
+    response = SESSION.post(
+        OPENAI_FILES_URL,
+        headers=auth,
+        data={"purpose": "batch"},
+        files={"file": ("batch.jsonl", b"\n".join(lines))},
+        timeout=UPSTREAM_TIMEOUT
+    )
+    if response.status_code != 200:
+        raise api_error(response)
+    
+    data = {
+        "input_file_id": loads(response.content)['id'],
+        "endpoint": "/v1/chat/completions",
+        "completion_window": "24h"
+    }
+    response = SESSION.post(OPENAI_BATCH_URL, headers=OPENAI_HEADERS, data=dumps(data), timeout=UPSTREAM_TIMEOUT)
+    if response.status_code != 200:
+        raise api_error(response)
+    return loads(response.content)['id']
+
+def parse_results(lines, size, extract):
+    """Order NDJSON batch results by custom_id, None for failed prompts"""
+    commands = [None] * size
+    for line in lines:
+        if not line.strip():
+            continue
+        item = loads(line)
+        try:
+            commands[int(item['custom_id'])] = extract(item)
+        except (KeyError, IndexError, TypeError, ValueError):
+            pass
+    return commands
+
+def fetch_anthropic_batch(batch_id):
+    """Return the status of an Anthropic batch and its commands once ended"""
+    response = SESSION.get(f"{ANTHROPIC_BATCH_URL}/{batch_id}", headers=ANTHROPIC_HEADERS, timeout=UPSTREAM_TIMEOUT)
+    if response.status_code != 200:
+        raise api_error(response)
+    batch = loads(response.content)
+    
+    if batch['processing_status'] != 'ended':
+        return batch['processing_status'], None
+    
+    counts = batch['request_counts']
+    response = SESSION.get(batch['results_url'], headers=ANTHROPIC_HEADERS, timeout=UPSTREAM_TIMEOUT)
+    if response.status_code != 200:
+        raise api_error(response)
+    
+    def extract(item):
+        return item['result']['message']['content'][0]['text'].strip()
+    
+    return 'completed', parse_results(response.content.splitlines(), sum(counts.values()), extract)
+
+def fetch_openai_batch(batch_id):
+    """Return the status of an OpenAI batch and its commands once completed"""
+    response = SESSION.get(f"{OPENAI_BATCH_URL}/{batch_id}", headers=OPENAI_HEADERS, timeout=UPSTREAM_TIMEOUT)
+    if response.status_code != 200:
+        raise api_error(response)
+    batch = loads(response.content)
+    
+    if batch['status'] != 'completed':
+        return batch['status'], None
+    
+    size = batch['request_counts']['total']
+    # A batch whose requests all failed completes with only an error file
+    if not batch.get('output_file_id'):
+        return 'completed', [None] * size
+    
+    response = SESSION.get(
+        f"{OPENAI_FILES_URL}/{batch['output_file_id']}/content",
+        headers=OPENAI_HEADERS,
+        timeout=UPSTREAM_TIMEOUT
+    )
+    if response.status_code != 200:
+        raise api_error(response)
+    
+    def extract(item):
+        return item['response']['body']['choices'][0]['message']['content'].strip()
+    
+    return 'completed', parse_results(response.content.splitlines(), size, extract)
+
+@app.route('/generate_batch', methods=['POST'])
+def generate_batch():
+    """Submit many prompts for asynchronous, discounted batch processing"""
+    data = read_json()
+    prompts = data.get('prompts') if data else None
+    if not isinstance(prompts, list) or not prompts:
+        return jsonify({'error': 'Missing prompts'}), 400
+    if len(prompts) > MAX_BATCH_PROMPTS:
+        return jsonify({'error': f'At most {MAX_BATCH_PROMPTS} prompts per batch'}), 400
+    if not all(valid_prompt(prompt) for prompt in prompts):
+        return jsonify({'error': f'Prompts must be strings of 1-{MAX_PROMPT_CHARS} characters'}), 400
+    
+    try:
+        user_id = get_user_id(request)
+        
+        # Every prompt in the batch counts against the daily limit
+        if not check_rate_limit(user_id, len(prompts)):
+            return jsonify({
+                'error': 'Rate limit exceeded',
+                'message': f'Daily limit of {DAILY_LIMIT} requests would be exceeded by this batch.'
+            }), 429
+        
+        if ANTHROPIC_API_KEY:
+            batch_id = submit_anthropic_batch(prompts)
+        elif OPENAI_API_KEY:
+            batch_id = submit_openai_batch(prompts)
+        else:
+            return jsonify({'error': 'No API keys configured on server'}), 500
+        
+        return jsonify({'batch_id': batch_id, 'status': 'in_progress'}), 202
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/generate_batch/<batch_id>', methods=['GET'])
+def get_batch(batch_id):
+    """Poll a submitted batch; commands are returned in prompt order"""
+    try:
+        # Anthropic batch ids are prefixed "msgbatch_", OpenAI ones "batch_"
+        if batch_id.startswith('msgbatch_'):
+            status, commands = fetch_anthropic_batch(batch_id)
+        elif batch_id.startswith('batch_'):
+            status, commands = fetch_openai_batch(batch_id)
+        else:
+            return jsonify({'error': 'Unknown batch id'}), 404
+        
+        result = {'batch_id': batch_id, 'status': status}
+        if commands is not None:
+            result['commands'] = commands
+        return jsonify(result)
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({'status': 'healthy', 'service': 'LAL API'})
+    with cache_lock:
+        cache = {**cache_stats, 'size': len(response_cache)}
+    return jsonify({'status': 'healthy', 'service': 'LAL API', 'cache': cache})
 
 @app.route('/usage/<user_token>', methods=['GET'])
 def get_usage(user_token):
     """Get usage statistics for a user"""
-    today = datetime.now().strftime('%Y-%m-%d')
-    key = f"{user_token}:{today}"
-    used = usage_tracker.get(key, 0)
+    today = current_day()
+    used = get_used(user_token, today)
     remaining = DAILY_LIMIT - used
     
     return jsonify({
@@ -165,4 +881,6 @@ def get_usage(user_token):
     })
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5001) 
\ No newline at end of file
+    # Local fallback; deploy with gunicorn (see gunicorn.conf.py)
+    from werkzeug.serving import run_simple
+    run_simple('0.0.0.0', 5001, app, threaded=True) 
\ No newline at end of file
@@ -0,0 +1,16 @@
+# Gunicorn settings for api_server (loaded automatically from the working directory)
+import multiprocessing
+import os
+
+# Without REDIS_URL the rate-limit counters and response cache live in each
+# worker process, so more than one worker would multiply DAILY_LIMIT per user.
+# Scale out across CPUs only when the counters are shared through Redis.
+default_workers = multiprocessing.cpu_count() if os.getenv('REDIS_URL') else 1
+workers = int(os.getenv('WEB_CONCURRENCY', default_workers))
+
+# Upstream calls release the GIL while waiting on the socket, so threaded
+# workers overlap many /generate requests per process
+worker_class = 'gthread'
+# Same LAL_WORKER_THREADS setting api_server uses to size its race pool
+threads = int(os.getenv('LAL_WORKER_THREADS', '16'))
+timeout = 60
@@ -54,7 +54,7 @@ show_usage() {
     echo ""
     
     # Get user ID (anonymous, based on IP)
-    user_id=$(echo -n "$(curl -s ipinfo.io/ip 2>/dev/null || echo 'unknown')" | md5sum | cut -d' ' -f1)
+    user_id=$(echo -n "$(curl -s ipinfo.io/ip 2>/dev/null || echo 'unknown')" | b2sum -l 128 | cut -d' ' -f1)
     
     # Call usage API
     usage_response=$(curl -s "${LAL_API_URL}/usage/${user_id}" 2>/dev/null)
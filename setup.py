@@ -27,7 +27,6 @@ setup(
     ],
     python_requires=">=3.8",
     install_requires=[
-        "click>=8.1.7",
         "openai>=1.55.0",
         "anthropic>=0.40.0",
         "rich>=13.9.4",